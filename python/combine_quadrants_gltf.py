@@ -1,92 +1,222 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
 import numpy as np
 import trimesh
+import trimesh.exchange.gltf
 import pymeshlab
+try:
+    import fast_simplification      # optional, native QEM on NumPy arrays
+except ImportError:
+    fast_simplification = None
 
 def load_gltf_mesh(filename):
-    mesh = trimesh.load(filename, force='mesh')
-    vertices = mesh.vertices
-    faces = mesh.faces
+    # Only positions and indices are needed, so call the glTF loader
+    # directly: no materials/textures decoded, no Scene or Trimesh built.
+    if filename.endswith('.glb'):
+        loader = trimesh.exchange.gltf.load_glb
+    else:
+        loader = trimesh.exchange.gltf.load_gltf
+    resolver = trimesh.resolvers.FilePathResolver(filename)
+    with open(filename, 'rb') as f:
+        kwargs = loader(file_obj=f, resolver=resolver, merge_primitives=True, skip_materials=True)
+    geometry = list(kwargs['geometry'].values())
+    if len(geometry) == 1:
+        return geometry[0]['vertices'], geometry[0]['faces']
+    # Several meshes in one file; stack them
+    offsets = np.cumsum([0] + [len(g['vertices']) for g in geometry[:-1]])
+    vertices = np.vstack([g['vertices'] for g in geometry])
+    faces = np.vstack([g['faces'] + offset for g, offset in zip(geometry, offsets)])
     return vertices, faces
 
-def shift_and_place(vertices, quadrant):
-    # Shift X and/or Y to proper quadrant:
-    # quadrant: 'tl', 'tr', 'bl', 'br'
-    if quadrant == 'tl':  # Top-left
-        return vertices + np.array([0, 256, 0])
-    if quadrant == 'tr':  # Top-right
-        return vertices + np.array([256, 256, 0])
-    if quadrant == 'bl':  # Bottom-left
-        return vertices
-    if quadrant == 'br':  # Bottom-right
-        return vertices + np.array([256, 0, 0])
-    raise ValueError("Invalid quadrant")
-
-def combine_meshes(quadrant_files):
-    all_vertices = []
-    all_faces = []
-    v_offset = 0
+# Offset of each quadrant in the combined mesh:
+# quadrant: 'tl', 'tr', 'bl', 'br'
+SHIFTS = {
+    'tl': np.array([0, 256, 0], dtype=np.float32),    # Top-left
+    'tr': np.array([256, 256, 0], dtype=np.float32),  # Top-right
+    'bl': np.array([0, 0, 0], dtype=np.float32),      # Bottom-left
+    'br': np.array([256, 0, 0], dtype=np.float32),    # Bottom-right
+}
+
+# Decimate each quadrant to QUADRANT_FRAC before combining, then the
+# stitched result to FINAL_FRAC: 0.4 * 0.25 is the same 10% overall.
+# The quadrant passes can run one per core.
+QUADRANT_FRAC = 0.4
+FINAL_FRAC = 0.25
+
+def combine_meshes(quadrant_files, quadrant_frac=None):
+    # First pass: load everything so the output sizes are known
+    names = []
+    loaded = []
     for name, file in quadrant_files.items():
-        v, f = load_gltf_mesh(file)
-        v = shift_and_place(v, name)
-        all_vertices.append(v)
-        all_faces.append(f + v_offset)
-        v_offset += v.shape[0]
-    vertices = np.vstack(all_vertices)
-    faces = np.vstack(all_faces)
+        if name not in SHIFTS:
+            raise ValueError("Invalid quadrant")
+        names.append(name)
+        loaded.append(load_gltf_mesh(file))
+    if quadrant_frac is not None:
+        # Quadrants are disjoint, so decimate them in parallel when there
+        # is more than one core. Boundaries are preserved, so the seams
+        # still line up for fill_gaps.
+        workers = min(len(loaded), os.cpu_count() or 1)
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                loaded = list(executor.map(mesh_reduction,
+                    [v for v, f in loaded], [f for v, f in loaded], [quadrant_frac] * len(loaded)))
+        else:
+            loaded = [mesh_reduction(v, f, quadrant_frac) for v, f in loaded]
+    quadrants = [(name, v, f) for name, (v, f) in zip(names, loaded)]
+    total_v = sum(v.shape[0] for name, v, f in quadrants)
+    total_f = sum(f.shape[0] for name, v, f in quadrants)
+    # Second pass: shift and copy each quadrant straight into its slice.
+    # float32 vertices and int32 faces halve the memory traffic downstream.
+    vertices = np.empty((total_v, 3), dtype=np.float32)
+    faces = np.empty((total_f, 3), dtype=np.int32)
+    v_offset = 0
+    f_offset = 0
+    for name, v, f in quadrants:
+        nv = v.shape[0]
+        nf = f.shape[0]
+        np.add(v, SHIFTS[name], out=vertices[v_offset:v_offset + nv])
+        np.add(f, v_offset, out=faces[f_offset:f_offset + nf])
+        v_offset += nv
+        f_offset += nf
     return vertices, faces
 
+# Seam between quadrants: last row/column of the low quadrant, first of the high one
+SEAM_LO = 255
+SEAM_HI = 256
+EDGE_TOL = 1e-3     # decimation keeps boundary vertices, but allow for float noise
+
+def seam_edge(vertices, axis, value, lo, hi):
+    # Indices of vertices with vertices[:, axis] == value and the other
+    # coordinate in lo..hi, sorted along the seam.
+    other = 1 - axis
+    sel = np.where((np.abs(vertices[:, axis] - value) < EDGE_TOL)
+        & (vertices[:, other] >= lo - EDGE_TOL)
+        & (vertices[:, other] <= hi + EDGE_TOL))[0]
+    return sel[np.argsort(vertices[sel, other], kind='stable')]
+
+def stitch_edges(vertices, a, b, axis):
+    # Triangle strip between two sorted edges a and b facing each other
+    # across a seam. Decimation may leave the two sides with different
+    # vertex counts, so walk both in order along the seam: each step
+    # advances one side by one vertex and emits one triangle.
+    if len(a) == 0 or len(b) == 0 or len(a) + len(b) < 3:
+        return np.empty((0, 3), dtype=np.int32)
+    other = 1 - axis
+    steps = np.concatenate([vertices[a[1:], other], vertices[b[1:], other]])
+    on_a = np.concatenate([np.ones(len(a) - 1, dtype=bool), np.zeros(len(b) - 1, dtype=bool)])
+    on_a = on_a[np.argsort(steps, kind='stable')]
+    ia = np.cumsum(on_a) - on_a         # position on a before each step
+    ib = np.cumsum(~on_a) - ~on_a       # position on b before each step
+    third = np.where(on_a, a[np.minimum(ia + 1, len(a) - 1)], b[np.minimum(ib + 1, len(b) - 1)])
+    return np.column_stack([a[ia], b[ib], third]).astype(np.int32)
+
+def winding(vertices, faces):
+    # Signed doubled area of each face in the XY plane
+    p0 = vertices[faces[:, 0], :2]
+    d1 = vertices[faces[:, 1], :2] - p0
+    d2 = vertices[faces[:, 2], :2] - p0
+    return d1[:, 0] * d2[:, 1] - d1[:, 1] * d2[:, 0]
+
 def fill_gaps(vertices, faces):
-    # To fill the seam between quadrants, we need to:
+    # To fill the seam between quadrants:
     # - For each meeting edge, construct new triangles between matching edge vertices.
     # - For the center (the "cross" where all 4 meet), add a quad (split into two triangles).
-    # This requires finding/creating the seam points.
 
-    # For 511x511 grid, X and Y coordinate ranges are 0..510
     # Each quadrant is 0..255 in its local X and Y
-    # Top-left (0..255, 256..510)
-    # Top-right (256..510, 256..510)
+    # Top-left (0..255, 256..511)
+    # Top-right (256..511, 256..511)
     # Bottom-left (0..255, 0..255)
-    # Bottom-right (256..510, 0..255)
+    # Bottom-right (256..511, 0..255)
+    # so the edges to connect are at X=255/256 and Y=255/256.
+    top = vertices[:, 1].max()
+    right = vertices[:, 0].max()
+    seams = [
+        # X seam, bottom half (bl | br) and top half (tl | tr)
+        (0, 0, SEAM_LO),
+        (0, SEAM_HI, top),
+        # Y seam, left half (bl / tl) and right half (br / tr)
+        (1, 0, SEAM_LO),
+        (1, SEAM_HI, right),
+    ]
+    seam_faces = [stitch_edges(vertices,
+            seam_edge(vertices, axis, SEAM_LO, lo, hi),
+            seam_edge(vertices, axis, SEAM_HI, lo, hi), axis)
+        for (axis, lo, hi) in seams]
 
-    # We'll need to connect the edges at X=255/256 and Y=255/256 for both axes.
-    # This is a simplified version: actual implementation needs careful vertex indexing and possibly vertex welding.
-    # For brevity, here is a placeholder for gap-filling code.
-    # In production, you'd build new vertices for the seam and add faces accordingly.
+    # Center cross: one quad between the four inner corners
+    corners = np.array([[SEAM_LO, SEAM_LO], [SEAM_HI, SEAM_LO], [SEAM_HI, SEAM_HI], [SEAM_LO, SEAM_HI]])
+    c = np.argmin(((vertices[None, :, :2] - corners[:, None, :]) ** 2).sum(axis=2), axis=1)
+    seam_faces.append(np.array([[c[0], c[1], c[2]], [c[0], c[2], c[3]]], dtype=np.int32))
+    seam_faces = np.concatenate(seam_faces)
 
-    # (This is a complex step; see note at bottom.)
+    # Match the winding of the existing faces and drop degenerate triangles.
+    area = winding(vertices, seam_faces)
+    sign = np.sign(winding(vertices, faces).sum()) if len(faces) else -1.0
+    seam_faces = seam_faces[area != 0]
+    flip = np.sign(area[area != 0]) != sign
+    seam_faces[flip] = seam_faces[flip][:, [0, 2, 1]]
+    faces = np.concatenate([faces, seam_faces.astype(faces.dtype)])
     return vertices, faces
 
+_MS = None
+
+def _get_meshset():
+    # One MeshSet per process; creating one loads all the filter plugins
+    global _MS
+    if _MS is None:
+        _MS = pymeshlab.MeshSet()
+    return _MS
+
 def mesh_reduction(vertices, faces, target_frac=0.1):
-    mesh = trimesh.Trimesh(vertices=vertices, faces=faces, process=False)
-    mesh.export('temp_combined.ply')
-    ms = pymeshlab.MeshSet()
-    ms.load_new_mesh('temp_combined.ply')
+    if fast_simplification is not None:
+        # In-memory decimation, no PLY round trip. Keep borders to avoid holes.
+        vertices, faces = fast_simplification.simplify(vertices.astype(np.float32, copy=False), faces.astype(np.uint32), 1.0 - target_frac, preserve_border=True)
+        return vertices, faces
+    ms = _get_meshset()
+    ms.clear()
+    ms.add_mesh(pymeshlab.Mesh(
+        vertex_matrix=np.asarray(vertices, dtype=np.float64),
+        face_matrix=faces.astype(np.int32)
+    ))
     ms.meshing_decimation_quadric_edge_collapse(
         targetfacenum=int(len(faces)*target_frac),
         preservenormal=True,
         preserveboundary=True,
-        preserveTopology=True,
+        preservetopology=True,
         qualitythr=1
     )
     m = ms.current_mesh()
     return m.vertex_matrix(), m.face_matrix()
 
-def generate_uvs(vertices):
-    # X: 0..510, Y: 0..510
-    u = vertices[:, 0] / 510.0
-    v = vertices[:, 1] / 510.0
-    return np.stack([u, v], axis=-1)
+def generate_uvs(vertices, x_range=(0, 511), y_range=(0, 511)):
+    # X: 0..511, Y: 0..511
+    inv = np.array([1.0 / (x_range[1] - x_range[0]), 1.0 / (y_range[1] - y_range[0])], dtype=np.float32)
+    off = np.array([x_range[0], y_range[0]], dtype=np.float32)
+    # One output buffer, no temporaries
+    uvs = np.empty((vertices.shape[0], 2), dtype=np.float32)
+    np.subtract(vertices[:, :2], off, out=uvs)
+    np.multiply(uvs, inv, out=uvs)
+    return uvs
 
-def export_gltf(vertices, faces, uvs, filename):
+def export_gltf(vertices, faces, uvs, filename, binary=True):
     mesh = trimesh.Trimesh(vertices=vertices, faces=faces, process=False)
     mesh.visual = trimesh.visual.texture.TextureVisuals(uv=uvs)
-    mesh.export(filename)
+    # Binary glTF stores the buffers as raw bytes instead of base64 JSON,
+    # so a .gltf name is written as its .glb sibling unless binary=False.
+    if binary and filename.endswith('.gltf'):
+        filename = filename[:-len('.gltf')] + '.glb'
+    if filename.endswith('.glb'):
+        mesh.export(filename, file_type='glb', include_normals=False)
+    else:
+        mesh.export(filename)
+    return filename
 
 if __name__ == "__main__":
     import sys
 
     if len(sys.argv) != 6:
-        print("Usage: python combine_quadrants_gltf.py topleft.gltf topright.gltf bottomleft.gltf bottomright.gltf output.gltf")
+        print("Usage: python combine_quadrants_gltf.py topleft.glb topright.glb bottomleft.glb bottomright.glb output.glb")
         sys.exit(1)
 
     quad_files = {
@@ -97,9 +227,9 @@ if __name__ == "__main__":
     }
     output = sys.argv[5]
 
-    vertices, faces = combine_meshes(quad_files)
+    vertices, faces = combine_meshes(quad_files, quadrant_frac=QUADRANT_FRAC)
     vertices, faces = fill_gaps(vertices, faces)
-    vertices, faces = mesh_reduction(vertices, faces, target_frac=0.1)
+    vertices, faces = mesh_reduction(vertices, faces, target_frac=FINAL_FRAC)
     uvs = generate_uvs(vertices)
-    export_gltf(vertices, faces, uvs, output)
-    print(f"Exported combined mesh to {output}")
+    written = export_gltf(vertices, faces, uvs, output)
+    print(f"Exported combined mesh to {written}")
@@ -3,30 +3,37 @@
 #   Animats
 #   License: LGPL.
 #
-from urllib.request import urlopen
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
 import json
+import logging
+import requests
 
 QUERY_URL = "http://api.gridsurvey.com/simquery.php?xy=%i,%i"
 QUERY_GRID = "aditi"    # only supported grid
 REGION_SIZE = 256
 MESH_UUID = "29ab2808-a708-9b7a-d44b-06f62d3d5e5b" # Our cube for flat impostors
+MAX_WORKERS = 16    # concurrent region queries
+HTTP_TIMEOUT = 30   # seconds
+
+#   One keep-alive session shared by all threads.
+_SESSION = requests.Session()
+_SESSION.mount("http://", requests.adapters.HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS))
+
+log = logging.getLogger(__name__)
+
 '''
 Fetch info for one region
 '''
 def fetch_region_info(coords) : 
     url = QUERY_URL % ((coords[0], coords[1]))
-    print("Fetching %s" % url)
-    fields = {}
-    with urlopen(url) as response :
-        data = response.read().decode('utf-8')  # Decode bytes to string
-        print(data)
-        items = data.splitlines()
-        fields = {}
-        for item in data.splitlines() :
-            kv = item.split(" ",1)
-            print(kv)
-            fields[kv[0]] = kv[1]
-        
+    log.debug("Fetching %s", url)
+    response = _SESSION.get(url, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    data = response.content.decode('utf-8')  # Decode bytes to string
+    log.debug("%s", data)
+    #   One "key value" pair per line
+    fields = dict(line.split(" ",1) for line in data.splitlines() if " " in line)
     return fields
             
 def build_impostor_struct(coords, fields) :
@@ -65,26 +72,32 @@ def test1() :
     json_data = json.dumps(impostor_data, indent=4)
     print("JSON data:\n", json_data)
    
+'''
+Fetch and build the impostor for one region. None if it failed.
+'''
+def scan_region(coords) :
+    try: 
+        fields = fetch_region_info(coords)
+        return build_impostor_struct(coords, fields)
+    except KeyError as err :
+        log.warning("Failed for [%i, %i]: %s", coords[0], coords[1], err)
+        return None
+   
 '''
 Scan a rectangular area of the map and output. Return JSON
 ''' 
 def scan_map_rectangle(ll, ur) :
-    items = []
-    for x in range(ll[0], ur[0]+1) : 
-        for y in range(ll[1], ur[1]+1) :
-            try: 
-                coords = [x,y]
-                fields = fetch_region_info(coords)
-                impostor_data = build_impostor_struct(coords, fields)
-                items.append(impostor_data)
-            except KeyError as err :
-                print("Failed for [%i, %i]: %s" % (x, y, err))
-    print("Done.")
+    coords_list = [[x,y] for (x, y) in product(range(ll[0], ur[0]+1), range(ll[1], ur[1]+1))]
+    #   Network-bound, so threads are fine. Map keeps the output in scan order.
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor :
+        items = [item for item in executor.map(scan_region, coords_list) if item is not None]
+    log.info("Done.")
     return items
-    
+
 
 
 if __name__ == "__main__" :
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     ####test1()
     jout = scan_map_rectangle([1130, 1046], [1139, 1054]) # Blake Sea
     outfile = "blakeseaimpostors.json"
@@ -1,46 +1,70 @@
-import imageio
+import imageio.v3 as iio
 import numpy as np
 import trimesh
 import pymeshlab
+try:
+    import fast_simplification      # optional, native QEM on NumPy arrays
+except ImportError:
+    fast_simplification = None
 
 def load_heightmap(filename, min_elev, max_elev):
-    img = imageio.imread(filename)
-    img = img.astype(np.float32)
-    height = min_elev + (img / 255.0) * (max_elev - min_elev)
+    img = iio.imread(filename)     # uint8 or uint16
+    full = 65535.0 if img.dtype == np.uint16 else 255.0
+    scale = (max_elev - min_elev) / full
+    # One pass, straight into the float32 result
+    height = np.empty(img.shape, dtype=np.float32)
+    np.multiply(img, scale, out=height, dtype=np.float32)
+    height += min_elev
     return height
 
+def _build_faces(h, w):
+    # i is the lower-left vertex of each quad, in row-major cell order
+    yy, xx = np.mgrid[0:h - 1, 0:w - 1]
+    i = (yy * w + xx).ravel()
+    # Two triangles, [v0, v2, v1] and [v1, v2, v3], interleaved per cell
+    faces = np.empty((2 * i.size, 3), dtype=np.int32)
+    faces[0::2] = np.stack([i, i + w, i + 1], axis=1)
+    faces[1::2] = np.stack([i + 1, i + w, i + w + 1], axis=1)
+    return faces
+
 def build_mesh(heightmap):
     h, w = heightmap.shape
-    # Create vertex grid
-    X, Y = np.meshgrid(np.arange(w), np.arange(h))
-    Z = heightmap
-    vertices = np.stack([X, Y, Z], axis=-1).reshape(-1, 3)
+    # Create vertex grid. Sparse grids are broadcast straight into
+    # the output columns, so the dense X and Y arrays are never built.
+    # float32 throughout; that's all glTF stores anyway.
+    ys, xs = np.meshgrid(np.arange(h, dtype=np.float32),
+                         np.arange(w, dtype=np.float32),
+                         indexing='ij', sparse=True)
+    vertices = np.empty((h * w, 3), dtype=np.float32)
+    grid = vertices.reshape(h, w, 3)    # view, not a copy
+    grid[:, :, 0] = xs
+    grid[:, :, 1] = ys
+    grid[:, :, 2] = heightmap
 
     # Build faces (two triangles per grid cell)
-    faces = []
-    for y in range(h - 1):
-        for x in range(w - 1):
-            i = y * w + x
-            # Vertices of the quad
-            v0 = i
-            v1 = i + 1
-            v2 = i + w
-            v3 = i + w + 1
-            # Two triangles
-            faces.append([v0, v2, v1])
-            faces.append([v1, v2, v3])
-    faces = np.array(faces, dtype=np.int64)
+    faces = _build_faces(h, w)
     return vertices, faces
 
+_MS = None
+
+def _get_meshset():
+    # One MeshSet per process; creating one loads all the filter plugins
+    global _MS
+    if _MS is None:
+        _MS = pymeshlab.MeshSet()
+    return _MS
+
 def mesh_reduction(vertices, faces, target_frac=0.1):
-    # Create trimesh
-    mesh = trimesh.Trimesh(vertices=vertices, faces=faces, process=False)
-    # Save to temporary file for pymeshlab
-    mesh.export('temp_mesh.ply')
-    ms = pymeshlab.MeshSet()
-    ms.load_new_mesh('temp_mesh.ply')
+    if fast_simplification is not None:
+        # In-memory decimation, no PLY round trip. Keep borders to avoid holes.
+        vertices, faces = fast_simplification.simplify(vertices.astype(np.float32, copy=False), faces.astype(np.uint32), 1.0 - target_frac, preserve_border=True)
+        return vertices, faces
+    # Hand the arrays to pymeshlab directly; no temporary file
+    ms = _get_meshset()
+    ms.clear()
+    ms.add_mesh(pymeshlab.Mesh(vertex_matrix=np.asarray(vertices, dtype=np.float64), face_matrix=faces.astype(np.int32)))
     # Simplification; preserve boundaries to avoid holes
-    ms.meshing_decimation_quadric_edge_collapse(targetfacenum=int(len(faces)*target_frac), preservenormal=True, preserveboundary=True, preserveTopology=True, qualitythr=1)
+    ms.meshing_decimation_quadric_edge_collapse(targetfacenum=int(len(faces)*target_frac), preservenormal=True, preserveboundary=True, preservetopology=True, qualitythr=1)
     m = ms.current_mesh()
     # Get reduced mesh data
     vertices = m.vertex_matrix()
@@ -49,24 +73,35 @@ def mesh_reduction(vertices, faces, target_frac=0.1):
 
 def generate_uvs(vertices, x_range, y_range):
     # X: 0..255, Y: 0..255
-    u = (vertices[:, 0] - x_range[0]) / (x_range[1] - x_range[0])
-    v = (vertices[:, 1] - y_range[0]) / (y_range[1] - y_range[0])
-    uvs = np.stack([u, v], axis=-1)
+    inv = np.array([1.0 / (x_range[1] - x_range[0]), 1.0 / (y_range[1] - y_range[0])], dtype=np.float32)
+    off = np.array([x_range[0], y_range[0]], dtype=np.float32)
+    # One output buffer, no temporaries
+    uvs = np.empty((vertices.shape[0], 2), dtype=np.float32)
+    np.subtract(vertices[:, :2], off, out=uvs)
+    np.multiply(uvs, inv, out=uvs)
     return uvs
 
-def export_gltf(vertices, faces, uvs, filename):
+def export_gltf(vertices, faces, uvs, filename, binary=True):
     mesh = trimesh.Trimesh(vertices=vertices, faces=faces, process=False)
     # glTF expects uvs as "visual.vertex_attributes"
     mesh.visual = trimesh.visual.texture.TextureVisuals(uv=uvs)
-    mesh.export(filename)
+    # Binary glTF stores the buffers as raw bytes instead of base64 JSON,
+    # so a .gltf name is written as its .glb sibling unless binary=False.
+    if binary and filename.endswith('.gltf'):
+        filename = filename[:-len('.gltf')] + '.glb'
+    if filename.endswith('.glb'):
+        mesh.export(filename, file_type='glb', include_normals=False)
+    else:
+        mesh.export(filename)
+    return filename
 
 if __name__ == "__main__":
     import sys
     import os
 
-    # Example usage: python heightmap_to_gltf.py input.png min_elev max_elev output.gltf
+    # Example usage: python heightmap_to_gltf.py input.png min_elev max_elev output.glb
     if len(sys.argv) != 5:
-        print("Usage: python heightmap_to_gltf.py input.png min_elev max_elev output.gltf")
+        print("Usage: python heightmap_to_gltf.py input.png min_elev max_elev output.glb")
         sys.exit(1)
     input_png = sys.argv[1]
     min_elev = float(sys.argv[2])
@@ -78,5 +113,5 @@ if __name__ == "__main__":
     # Reduce mesh to 10% faces (adjust as needed)
     vertices, faces = mesh_reduction(vertices, faces, target_frac=0.1)
     uvs = generate_uvs(vertices, (0,255), (0,255))
-    export_gltf(vertices, faces, uvs, output_gltf)
-    print(f"Exported reduced mesh to {output_gltf}")
+    written = export_gltf(vertices, faces, uvs, output_gltf)
+    print(f"Exported reduced mesh to {written}")
@@ -1,6 +1,10 @@
 #   Map tile definitions
 #
 import math
+import logging
+
+log = logging.getLogger(__name__)
+
 """
 Useful calculator for map tile math
 """
@@ -33,29 +37,30 @@ def tilecalc(coords, size) :
         raise ValueError("X or Y not a multiple of 256")
     xtile = x / 256
     ytile = y / 256
-    print("Tile X, Y: (%i,%i)" % (xtile, ytile))
+    log.info("Tile X, Y: (%i,%i)", xtile, ytile)
     if (size % 256 != 0) :
         raise ValueError("Size not a multiple of 256")
     tilesize = size / 256
     lod = lodcalc(tilesize)
     if (x % size == 0 and y % size == 0) :
-        print("Tile is size-aligned.")
+        log.info("Tile is size-aligned.")
     else :
         xaligned = int(x/size)*size
         yaligned = int(y/size)*size
-        print("Tile is not size-aligned. Aligned corner is at (%i,%i)." % (xaligned, yaligned))
+        log.info("Tile is not size-aligned. Aligned corner is at (%i,%i).", xaligned, yaligned)
         
 """
 Calculate LOD from size
 """
 def lodcalc(size) :
     lod = math.floor(math.log2(size))
-    print("LOD: %i" % lod)
+    log.info("LOD: %i", lod)
     if (pow(2,lod) != size) :
         raise ValueError("Size %i is not a power of 2" % (size))
     lod
     
     
 if __name__ == "__main__" :
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     calculator()
 
@@ -2,14 +2,16 @@
 #
 
 class RegionBox :
+    __slots__ = ('pos', 'size')     # lots of these get made; keep them small
+    
     def __init__(self, pos, size) :
         """
-        Usual new
+        Usual new. pos and size are stored as tuples.
         """
         assert(len(pos) == 2);
         assert(len(size) == 2);
-        self.pos = pos
-        self.size = size
+        self.pos = tuple(pos)
+        self.size = tuple(size)
         
         
     def union(self, other) :
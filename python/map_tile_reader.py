@@ -3,13 +3,26 @@
 #   Animats
 #   License: LGPL.
 #
-from urllib.request import urlopen
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
 import json
+import logging
+import os
+import requests
 from map_tile_defs import RegionBox
 
+log = logging.getLogger(__name__)
+
 #   A map tile URL looks like this: https://secondlife-maps-cdn.akamaized.net/map-4-1000-1000-objects.jpg
 MAP_FILENAME = "map-%i-%i-%i-objects.jpg"
 MAP_TILE_URL = "https://secondlife-maps-cdn.akamaized.net/%s"
+MAX_WORKERS = 16   # concurrent tile fetches
+HTTP_TIMEOUT = 30  # seconds
+
+#   One keep-alive session shared by all threads, so tile fetches
+#   from the CDN don't redo the TCP/TLS handshake each time.
+_SESSION = requests.Session()
+_SESSION.mount("https://", requests.adapters.HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS))
 
 '''
 Fetch one map tile. x and y are in units of regions.
@@ -18,9 +31,10 @@ LOD 1 is a one-region map tile here.
 '''
 def fetch_map_tile(lod, filename) :
     url = MAP_TILE_URL % (filename)
-    print("Reading", url)
-    with urlopen(url) as response :
-        return response.read()
+    log.debug("Reading %s", url)
+    response = _SESSION.get(url, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    return response.content
         
 def construct_map_tile_filename(lod, coords) :
     return MAP_FILENAME % (lod, coords[0], coords[1])
@@ -31,8 +45,8 @@ Are these coords valid for this LOD?
 Must be a multiple of a power of 2 of LOD-1
 '''
 def coords_valid_for_lod(lod, coords) :
-    scale = pow(2,lod-1)
-    return coords[0] % scale == 0 and coords[1] % scale == 0
+    mask = (1 << (lod-1)) - 1     # scale is a power of 2, so mask instead of %
+    return (coords[0] & mask) == 0 and (coords[1] & mask) == 0
 
 '''
 Scan a rectangular area of the map and output. Save images.
@@ -42,62 +56,62 @@ size 1 tiles are available by UUID already.
 ''' 
 def download_map_rectangle_old(ll, ur, directory) :
     items = []
-    for x in range(ll[0], ur[0]+1) : 
-        for y in range(ll[1], ur[1]+1) :
-            for lod in range(2,5) :
-                try: 
-                    coords = [x,y]
-                    if not coords_valid_for_lod(lod, coords) :
-                        continue
-                    filename = construct_map_tile_filename(lod, coords)
-                    img = fetch_map_tile(lod, filename)
-                    path = directory + "/" + filename
-                    with open(filename, "wb") as outfile :
-                        outfile.write(img)
-                        print(" Wrote " + filename)
-                except KeyError as err :
-                    print("Failed for [%i, %i]: %s" % (x, y, err))
-    print("Done.")
+    lods = range(2,5)
+    coords_iter = product(range(ll[0], ur[0]+1), range(ll[1], ur[1]+1))
+    tasks = [(lod, [x,y], directory) for (x, y) in coords_iter for lod in lods
+        if coords_valid_for_lod(lod, [x,y])]
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor :
+        list(executor.map(lambda task: download_map_tile(*task), tasks))
+    log.info("Done.")
     return items
     
-def download_map_tile(box, lod, directory) :
+def download_map_tile(lod, coords, directory) :
     """
-    Download relevant map tile
+    Download relevant map tile. Returns bytes written.
+    
+    Callers only pass coords valid for this LOD.
     """
     try: 
-        coords = [int(box.pos[0] / 256), int(box.pos[1] / 256)]
-        assert(coords_valid_for_lod(lod, coords))
         filename = construct_map_tile_filename(lod, coords)
         img = fetch_map_tile(lod, filename)
-        path = directory + "/" + filename
-        with open(filename, "wb") as outfile :
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, filename)
+        with open(path, "wb") as outfile :
             outfile.write(img)
-            print(" Wrote " + filename)
+            log.debug(" Wrote %s", path)
+        return len(img)
     except KeyError as err :
-        print("Failed for [%i, %i]: %s" % (x, y, err))
-    print("Done.")  
+        log.warning("Failed for [%i, %i]: %s", coords[0], coords[1], err)
+        return 0
     
 def download_map_rectangles(fullbox, directory) :
+    #   Collect all the tiles first, then fetch them in parallel.
+    tasks = []
     for lod in range (2,8) :
-        scaling = int(pow(2,lod-1))
+        scaling = 1 << (lod-1)
         # We want all boxes at this LOD which overlap fullbox
         boxsize = scaling*256
-        print("LOD: %i, scaling %i, boxsize: %i" % (lod, scaling, boxsize))
+        log.info("LOD: %i, scaling %i, boxsize: %i", lod, scaling, boxsize)
         #   Round down to get starting position that may be partly off edge of fullbox
-        xstart = int(int(fullbox.pos[0]) / boxsize) * boxsize
-        ystart = int(int(fullbox.pos[1]) / boxsize) * boxsize
+        xstart = int(fullbox.pos[0]) // boxsize * boxsize
+        ystart = int(fullbox.pos[1]) // boxsize * boxsize
         xend = int(fullbox.pos[0] + fullbox.size[0] + boxsize)
         yend = int(fullbox.pos[1] + fullbox.size[1] + boxsize)
-        print(xstart, xend, boxsize) 
-        for x in range (xstart, xend, boxsize) :
-            for y in range (ystart, yend, boxsize) :
-                thisbox = RegionBox([x, y], [boxsize, boxsize])
-                download_map_tile(thisbox, lod, directory)
-        
-    
+        log.debug("%i %i %i", xstart, xend, boxsize)
+        #   Step in tile units. Starts are multiples of boxsize, so every
+        #   tile visited is already valid for this LOD.
+        for tx in range (xstart // 256, -(-xend // 256), scaling) :
+            for ty in range (ystart // 256, -(-yend // 256), scaling) :
+                tasks.append((lod, [tx, ty], directory))
+    #   Network-bound, so threads are fine.
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor :
+        total = sum(executor.map(lambda task: download_map_tile(*task), tasks))
+    log.info("Done. %i tiles, %i bytes.", len(tasks), total)
+
 
 
 if __name__ == "__main__" :
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     outdir = "tileimages"
     boxll = RegionBox([1130*256, 1046*256], [256, 256])
     boxur = RegionBox([1139*256, 1054*256], [256, 256])